@@ -1,146 +1,634 @@
 import os
+import asyncio
+import aiohttp
 from slack_sdk import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.http_retry.builtin_handlers import ConnectionErrorRetryHandler, RateLimitErrorRetryHandler
+from slack_sdk.http_retry.builtin_async_handlers import AsyncConnectionErrorRetryHandler, AsyncRateLimitErrorRetryHandler
 from slack_sdk.errors import SlackApiError
 from datetime import datetime, timedelta
-from anthropic import Anthropic
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from anthropic import AsyncAnthropic
 import json
+import orjson
+import hashlib
+import time
+
+# Optional dependencies for the semantic summary cache
+try:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    faiss = None
+
+# Claude model settings
+MODEL = "claude-3-sonnet-20240229"
+MAX_TOKENS = 1000
+
+# Static instructions, sent as the system prompt. These are module-level
+# constants so the prefix is byte-identical on every call and Anthropic's
+# prompt cache hits reliably. Messages are never interpolated into them: they
+# are sent as the user message content as-is, so no per-call templating is needed.
+_DIGEST_INSTRUCTIONS = (
+    "Here are a set of Slack messages from a conversation.\n"
+    "I would like you to provide a digest of these messages for participants in this conversion.\n"
+    "Please:\n"
+    "1. Introduce yourself at the start of the summary;\n"
+    "2. Provide a concise summary of the key points discussed;\n"
+    "2. Extract specific action items, including who is responsible if mentioned;\n"
+    "3. Note any important decisions made.\n"
+    "\n"
+    "Please be polite, upbeat, and encouraging. Please use emojis!\n"
+    "\n"
+    "Please record your digest using the emit_digest tool.\n"
+    "\n"
+)
+PROMPT_PREFIX = _DIGEST_INSTRUCTIONS + "The messages are provided in the user message.\n"
+
+# Instructions for summarising one chunk of a long conversation (map step)
+CHUNK_PROMPT_PREFIX = (
+    "Here is one part of a longer Slack conversation.\n"
+    "Please summarise the key points discussed in this part, extract any action items, "
+    "including who is responsible if mentioned, and note any important decisions made.\n"
+    "Your summary will be merged with summaries of the other parts, so don't introduce yourself.\n"
+    "\n"
+    "Please record your summary using the emit_digest tool.\n"
+    "\n"
+    "The messages are provided in the user message.\n"
+)
+
+# Instructions for merging the chunk summaries (reduce step)
+REDUCE_PROMPT_PREFIX = (
+    _DIGEST_INSTRUCTIONS
+    + "The user message contains digests of consecutive parts of the conversation, "
+    "newest first, as JSON. Please merge them into a single digest.\n"
+)
+
+# Tool Claude is forced to call, so the digest comes back as structured input
+DIGEST_TOOL = {
+    "name": "emit_digest",
+    "description": "Record the digest of a set of Slack messages.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "summary": {
+                "type": "string",
+                "description": "Summary of the key points discussed"
+            },
+            "action_items": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Action items, including who is responsible if mentioned"
+            },
+            "decisions": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Important decisions made"
+            }
+        },
+        "required": ["summary", "action_items", "decisions"]
+    }
+}
+
+# Summaries of long conversations are map-reduced over chunks of this many tokens
+CHUNK_TOKENS = 3000
+# Max in-flight Claude requests
+SUMMARY_CONCURRENCY = 5
+
+# Semantic cache settings
+SEMANTIC_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.97
+# Max difference in message count for a cached summary to be reused
+SEMANTIC_CACHE_MAX_DELTA = 2
+# Nearest neighbours checked for a match that is in date and scope
+SEMANTIC_CACHE_CANDIDATES = 5
+# The embedding model truncates input at 256 word pieces, so the messages are
+# embedded in pieces of this many tokens and the embeddings averaged
+SEMANTIC_EMBED_TOKENS = 200
+
+# Number of time windows paged concurrently when fetching history
+FETCH_WINDOWS = 8
+# Max in-flight conversations.history requests
+FETCH_CONCURRENCY = 4
+# Request budget for conversations.history (Slack Tier 3 allows ~50 per minute)
+FETCH_REQUESTS_PER_MINUTE = 50
+# Max open HTTP connections to Slack per fetch
+SLACK_CONNECTION_LIMIT = 10
+# Pages buffered per window while earlier windows are consumed
+FETCH_QUEUE_PAGES = 2
+# Slack API errors that stop a fetch rather than being raised, including
+# ratelimited once the retry handler has given up
+TERMINAL_SLACK_ERRORS = frozenset({
+    "ratelimited",
+    "invalid_auth",
+    "not_authed",
+    "channel_not_found",
+    "not_in_channel",
+    "missing_scope"
+})
+
+# Output file layout
+MESSAGES_HEADER = "=== Original Messages ===\n\n"
+SUMMARY_HEADER = "\n=== Summary ===\n\n"
+# Buffer writes to the output file to minimise write syscalls
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Digest lists posted to Slack, as (summary key, section title)
+LIST_SECTIONS = (
+    ("action_items", "Action Items"),
+    ("decisions", "Key Decisions")
+)
+
+# Message subtypes that carry no conversation content
+SKIP_SUBTYPES = frozenset({
+    "channel_join",
+    "channel_leave",
+    "channel_topic",
+    "channel_purpose",
+    "pinned_item"
+})
+
+def _is_relevant(msg):
+    """Check whether a message is worth summarising."""
+    return bool(msg.get("text", "").strip()) and msg.get("subtype") not in SKIP_SUBTYPES
+
+def _dumps_summary(summary):
+    """Serialise a summary as indented JSON text."""
+    return orjson.dumps(summary, option=orjson.OPT_INDENT_2).decode()
+
+@lru_cache(maxsize=4096)
+def _fmt_ts(sec):
+    """Format a Unix timestamp in whole seconds as local time."""
+    return datetime.fromtimestamp(sec).isoformat(sep=' ', timespec='seconds')
+
+def _format_message(msg):
+    """Format a message as a "timestamp: text" line."""
+    # Memoised on the whole second, as busy channels send many messages per second
+    return f"{_fmt_ts(int(float(msg['ts'])))}: {msg.get('text', '')}"
+
+def _format_messages(messages):
+    """Format messages as "timestamp: text" lines."""
+    return [_format_message(msg) for msg in messages]
+
+def _dedupe(formatted_messages):
+    """Drop newest-first formatted messages whose text repeats an earlier message."""
+    # Walk oldest first so each text keeps the timestamp of its first occurrence.
+    # 8-byte digests keep the seen set small on huge channels.
+    seen = set()
+    deduped = []
+    for line in reversed(formatted_messages):
+        text = line.partition(": ")[2]
+        key = hashlib.blake2b(text.strip().lower().encode(), digest_size=8).digest()
+        if key not in seen:
+            seen.add(key)
+            deduped.append(line)
+    return deduped[::-1]
+
+def _chunk_by_tokens(formatted_messages, max_tokens=CHUNK_TOKENS):
+    """Group newest-first formatted messages into chunks of roughly max_tokens tokens."""
+    # Pack from the oldest message so new messages only change the newest
+    # chunk, keeping the other chunks' cache keys stable between runs
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for line in reversed(formatted_messages):
+        # Estimate ~4 characters per token
+        line_tokens = len(line) // 4 + 1
+        if chunk and chunk_tokens + line_tokens > max_tokens:
+            chunks.append("\n".join(reversed(chunk)))
+            chunk = []
+            chunk_tokens = 0
+        chunk.append(line)
+        chunk_tokens += line_tokens
+    if chunk:
+        chunks.append("\n".join(reversed(chunk)))
+    return chunks[::-1]
+
+def _mrkdwn_section(text):
+    """Build a Slack section block of mrkdwn text."""
+    return {
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": text
+        }
+    }
+
+def _slack_ts(us):
+    """Format Unix microseconds as a Slack timestamp string."""
+    return f"{us // 1_000_000}.{us % 1_000_000:06d}"
+
+class _Pacer:
+    """Space requests at least interval seconds apart to stay within a rate limit."""
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = 0.0
+
+    async def wait(self):
+        """Wait for the next free request slot."""
+        # Reserve a slot before sleeping, so concurrent callers queue up behind it
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        await asyncio.sleep(slot - now)
 
 class SlackerBot:
-    def __init__(self, slack_token, anthropic_api_key):
+    def __init__(self, slack_token, anthropic_api_key, cache_file="../data/llm_cache.json", cache_ttl_seconds=None,
+                 semantic_cache=False, semantic_cache_file="../data/sem_cache.faiss"):
         """Initialise with Anthropic and Slack API keys"""
-        self.slack_client = WebClient(token=slack_token)
-        self.anthropic_client = Anthropic(api_key=anthropic_api_key)
+        # Retry HTTP 429s, honouring Retry-After, and transient connection errors
+        self.slack_client = WebClient(
+            token=slack_token,
+            retry_handlers=[
+                RateLimitErrorRetryHandler(max_retry_count=3),
+                ConnectionErrorRetryHandler(max_retry_count=2)
+            ]
+        )
+        self.async_slack_client = AsyncWebClient(
+            token=slack_token,
+            retry_handlers=[
+                AsyncRateLimitErrorRetryHandler(max_retry_count=3),
+                AsyncConnectionErrorRetryHandler(max_retry_count=2)
+            ]
+        )
+        self.anthropic_api_key = anthropic_api_key
+
+        # Summary cache, loaded lazily on first use
+        self.cache_file = cache_file
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._cache = None
+        self._cache_dirty = False
+
+        # Opt-in semantic cache for near-duplicate message sets, loaded lazily on first use
+        self.semantic_cache = semantic_cache
+        self.semantic_cache_file = semantic_cache_file
+        self._semantic_model = None
+        self._semantic_index = None
+        self._semantic_entries = None
+        self._semantic_failed = False
         
+    def _fetch_windows(self, start_time, end_time):
+        """Split a timeframe into non-overlapping Slack (oldest, latest) windows, newest first."""
+        # Convert timestamps to Unix microseconds
+        start_us = round(start_time.timestamp() * 1_000_000)
+        end_us = round(end_time.timestamp() * 1_000_000)
+
+        bounds = [start_us + (end_us - start_us) * i // FETCH_WINDOWS for i in range(FETCH_WINDOWS)]
+        bounds.append(end_us + 1)
+        windows = [
+            (_slack_ts(oldest), _slack_ts(latest - 1))
+            for oldest, latest in zip(bounds, bounds[1:])
+        ]
+        return windows[::-1]
+
+    async def _fetch_window(self, channel_id, oldest, latest, semaphore, pacer, queue):
+        """Put every page of a single time window on a queue, then None when done."""
+        cursor = None
+        try:
+            # Handle pagination (cursors are sequential within a window)
+            while True:
+                async with semaphore:
+                    await pacer.wait()
+                    result = await self.async_slack_client.conversations_history(
+                        channel=channel_id,
+                        oldest=oldest,
+                        latest=latest,
+                        inclusive=True,
+                        cursor=cursor,
+                        limit=100
+                    )
+                await queue.put(result["messages"])
+
+                if not result.get("has_more", False):
+                    break
+                cursor = result["response_metadata"]["next_cursor"]
+
+        # Hand errors to the consumer rather than leaving it waiting
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    async def _open_session(self):
+        """Open one HTTP session for a fetch, so Slack connections are kept alive between pages."""
+        # Without a session the async client opens a new connection per request
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=SLACK_CONNECTION_LIMIT))
+
+    def iter_messages(self, channel_id, start_time, end_time):
+        """Yield messages from Slack channel within a specified timeframe, page by page."""
+        # Slack only returns a next_cursor, so page each time window concurrently.
+        # Bounded queues keep at most FETCH_QUEUE_PAGES pages per window in memory.
+        loop = asyncio.new_event_loop()
+        self.async_slack_client.session = loop.run_until_complete(self._open_session())
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+        pacer = _Pacer(60 / FETCH_REQUESTS_PER_MINUTE)
+        queues = []
+        tasks = []
+        for oldest, latest in self._fetch_windows(start_time, end_time):
+            queue = asyncio.Queue(maxsize=FETCH_QUEUE_PAGES)
+            queues.append(queue)
+            tasks.append(loop.create_task(self._fetch_window(channel_id, oldest, latest, semaphore, pacer, queue)))
+
+        try:
+            # Drain windows newest first to keep Slack's newest-first ordering
+            for queue in queues:
+                while True:
+                    page = loop.run_until_complete(queue.get())
+                    if page is None:
+                        break
+                    if isinstance(page, Exception):
+                        raise page
+                    # Drop system events and empty messages to save prompt tokens
+                    yield from filter(_is_relevant, page)
+
+        # Errors are raised to the caller, so a failed fetch is never mistaken for a complete one
+        finally:
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(self.async_slack_client.session.close())
+            self.async_slack_client.session = None
+            loop.close()
+
     def fetch_messages(self, channel_id, start_time, end_time):
         """Fetch messages from Slack channel within a specified timeframe."""
         try:
-            # Convert timestamps to Unix timestamps
-            start_ts = start_time.timestamp()
-            end_ts = end_time.timestamp()
-            
-			# Load message list
-            messages = []
-            result = self.slack_client.conversations_history(
-                channel=channel_id,
-                oldest=start_ts,
-                latest=end_ts,
-                limit=100  
-            )
-            messages.extend(result["messages"])
-            
-            # Handle pagination 
-            while result.get("has_more", False):
-                result = self.slack_client.conversations_history(
-                    channel=channel_id,
-                    oldest=start_ts,
-                    latest=end_ts,
-                    cursor=result["response_metadata"]["next_cursor"],
-                    limit=100
-                )
-                messages.extend(result["messages"])
-            
-			# Return message list
-            return messages
-        
-		# Handle API error
+            return list(self.iter_messages(channel_id, start_time, end_time))
+
+        # Handle API errors that retrying won't fix; anything else is raised
         except SlackApiError as e:
+            if e.response["error"] not in TERMINAL_SLACK_ERRORS:
+                raise
             print(f"Error fetching messages: {e.response['error']}")
             return []
 
-    def generate_summary(self, messages):
-        """Generate summary using Claude."""
-        if not messages:
-            return "No messages found in the specified timeframe."
-            
-        formatted_messages = []
-        for msg in messages:
-            timestamp = datetime.fromtimestamp(float(msg["ts"]))
-            formatted_messages.append(f"{timestamp}: {msg.get('text', '')}")
-        
-        messages_text = "\n".join(formatted_messages)
+    def _cache_key(self, system, prompt):
+        """Hash the request parameters into a cache key."""
+        request = {
+            "model": MODEL,
+            "max_tokens": MAX_TOKENS,
+            "tools": [DIGEST_TOOL],
+            "system": system,
+            "prompt": prompt
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
 
-        # print("---> Formatted messages:\n", messages_text)
-        
-        prompt = f"""
+    def _cache_expired(self, entry):
+        """Check whether a cache entry is older than the TTL."""
+        return self.cache_ttl_seconds is not None and time.time() - entry.get("ts", 0) > self.cache_ttl_seconds
 
-            Here are a set of Slack messages from a conversation. 
-            I would like you to provide a digest of these messages for participants in this conversion. 
-            Please:
-            1. Introduce yourself; 
-            2. Provide a concise summary of the key points discussed;
-            2. Extract specific action items, including who is responsible if mentioned;
-            3. Note any important decisions made.
+    def _cache_load(self):
+        """Load the summary cache from disk, if not already loaded, dropping expired entries."""
+        if self._cache is None:
+            try:
+                with open(self.cache_file, 'rb') as f:
+                    cache = orjson.loads(f.read())
+            except (FileNotFoundError, orjson.JSONDecodeError):
+                cache = {}
+            except OSError as e:
+                print(f"Error reading summary cache: {e}")
+                cache = {}
+            self._cache = {key: entry for key, entry in cache.items() if not self._cache_expired(entry)}
+            self._cache_dirty = len(self._cache) != len(cache)
+
+    def _cache_lookup(self, key):
+        """Return a cached summary, or None on a miss or expired entry."""
+        self._cache_load()
+        entry = self._cache.get(key)
+        if entry is None or self._cache_expired(entry):
+            return None
+        return entry["value"]
 
-            Please be polite, upbeat, and encouraging. Please use emojis!
+    def _cache_store(self, key, value):
+        """Store a summary in memory; _cache_flush writes it to disk."""
+        self._cache[key] = {"ts": time.time(), "value": value}
+        self._cache_dirty = True
 
-            Messages:
-            {messages_text}
+    def _cache_flush(self):
+        """Write the cache to disk, without expired entries, if it has changed."""
+        if not self._cache_dirty:
+            return
+        self._cache = {key: entry for key, entry in self._cache.items() if not self._cache_expired(entry)}
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            with open(self.cache_file, 'wb') as f:
+                f.write(orjson.dumps(self._cache))
+            self._cache_dirty = False
+        except OSError as e:
+            print(f"Error writing summary cache: {e}")
 
-            Please format your response as JSON with the following structure:
-            {{
-                "summary": "Overall summary here",
-                "action_items": ["Action 1", "Action 2", ...],
-                "decisions": ["Decision 1", "Decision 2", ...]
-            }}
-        """
+    def _semantic_metadata_file(self):
+        """Path of the JSON lines file holding summaries for the semantic index."""
+        return os.path.splitext(self.semantic_cache_file)[0] + ".jsonl"
+
+    def _semantic_load(self):
+        """Load the embedding model, FAISS index and summaries. Returns False if unavailable."""
+        if not self.semantic_cache or faiss is None or self._semantic_failed:
+            return False
+        if self._semantic_index is not None:
+            return True
+
+        # The cache is optional, so a model that can't be loaded disables it
+        try:
+            self._semantic_model = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+        except Exception as e:
+            print(f"Error loading semantic cache model, skipping semantic cache: {e}")
+            self._semantic_failed = True
+            return False
 
         try:
-            response = self.anthropic_client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
+            self._semantic_index = faiss.read_index(self.semantic_cache_file)
+            with open(self._semantic_metadata_file(), 'rb') as f:
+                self._semantic_entries = [orjson.loads(line) for line in f]
+        except (RuntimeError, FileNotFoundError, orjson.JSONDecodeError):
+            self._semantic_index = None
+
+        # An interrupted or failed write can leave the index and summaries out
+        # of step, and then ids no longer line up; start afresh if so
+        if self._semantic_index is not None and self._semantic_index.ntotal != len(self._semantic_entries):
+            print("Semantic cache index and summaries differ, rebuilding semantic cache")
+            self._semantic_index = None
+
+        if self._semantic_index is None:
+            dim = self._semantic_model.get_sentence_embedding_dimension()
+            self._semantic_index = faiss.IndexFlatIP(dim)
+            self._semantic_entries = []
+
+        # Drop expired summaries; the files are rewritten on the next store
+        keep = [i for i, entry in enumerate(self._semantic_entries) if not self._cache_expired(entry)]
+        if len(keep) != len(self._semantic_entries):
+            vectors = self._semantic_index.reconstruct_n(0, self._semantic_index.ntotal)
+            self._semantic_index = faiss.IndexFlatIP(self._semantic_index.d)
+            if keep:
+                self._semantic_index.add(vectors[keep])
+            self._semantic_entries = [self._semantic_entries[i] for i in keep]
+        return True
+
+    def _semantic_embed(self, formatted_messages):
+        """Embed the whole message set as a normalised vector, or None if unavailable."""
+        if not self._semantic_load():
+            return None
+        pieces = _chunk_by_tokens(formatted_messages, SEMANTIC_EMBED_TOKENS)
+        try:
+            embeddings = self._semantic_model.encode(pieces, normalize_embeddings=True)
+        except Exception as e:
+            print(f"Error embedding messages, skipping semantic cache: {e}")
+            return None
+        embedding = embeddings.mean(axis=0, keepdims=True).astype("float32")
+        faiss.normalize_L2(embedding)
+        return embedding
+
+    def _semantic_scope(self):
+        """Hash the request settings (model, prompt, tools) a summary depends on."""
+        return self._cache_key(PROMPT_PREFIX, None)
+
+    def _semantic_lookup(self, embedding, n_messages, last_ts):
+        """Return the summary of a near-duplicate message set, or None."""
+        if embedding is None or self._semantic_index.ntotal == 0:
+            return None
+
+        # Inner product of normalised vectors is cosine similarity
+        scores, ids = self._semantic_index.search(embedding, SEMANTIC_CACHE_CANDIDATES)
+        scope = self._semantic_scope()
+        for score, i in zip(scores[0], ids[0]):
+            if i < 0 or i >= len(self._semantic_entries) or score < SEMANTIC_CACHE_THRESHOLD:
+                break
+            entry = self._semantic_entries[i]
+
+            # Skip summaries made with another model or prompt, or expired ones
+            if entry.get("scope") != scope or self._cache_expired(entry):
+                continue
+
+            # Guard against over-matching: the cached set must not cover newer
+            # messages, and may only differ by a couple of messages
+            if entry["last_ts"] > last_ts:
+                continue
+            if abs(entry["n_messages"] - n_messages) > SEMANTIC_CACHE_MAX_DELTA:
+                continue
+            return entry["value"]
+        return None
+
+    def _semantic_store(self, embedding, n_messages, last_ts, value):
+        """Add a summary to the semantic index and persist both files in full."""
+        if embedding is None:
+            return
+        entry = {
+            "ts": time.time(),
+            "scope": self._semantic_scope(),
+            "n_messages": n_messages,
+            "last_ts": last_ts,
+            "value": value
+        }
+        self._semantic_index.add(embedding)
+        self._semantic_entries.append(entry)
+        try:
+            os.makedirs(os.path.dirname(self.semantic_cache_file) or ".", exist_ok=True)
+            faiss.write_index(self._semantic_index, self.semantic_cache_file)
+            with open(self._semantic_metadata_file(), 'wb') as f:
+                f.writelines(orjson.dumps(e) + b"\n" for e in self._semantic_entries)
+        except (OSError, RuntimeError) as e:
+            print(f"Error writing semantic cache: {e}")
+
+    async def _create_digest(self, client, semaphore, system, content):
+        """Ask Claude for a digest of some content, checking the summary cache first."""
+        cache_key = self._cache_key(system, content)
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            return cached
+
+        async with semaphore:
+            response = await client.messages.create(
+                model=MODEL,
+                max_tokens=MAX_TOKENS,
+                system=[{
+                    "type": "text",
+                    "text": system,
+                    "cache_control": {"type": "ephemeral"}
+                }],
+                messages=[{"role": "user", "content": content}],
+                tools=[DIGEST_TOOL],
+                tool_choice={"type": "tool", "name": DIGEST_TOOL["name"]}
             )
-            
-            # Extract JSON from Claude's response
-            try:
-                # The response content might contain explanation text before or after the JSON
-                # We need to find and extract just the JSON part
-                response_text = response.content[0].text
-                
-                # print("---> Generated response text:\n", response_text)
-                
-                # Find the JSON structure in the response
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}') + 1
-                
-                if start_idx != -1 and end_idx != 0:
-                    json_str = response_text[start_idx:end_idx]
-                    summary_data = json.loads(json_str)
-                    return summary_data
-                else:
-                    # Fallback structure if JSON parsing fails
-                    print("JSON parsing failed, falling back...")
-                    return {
-                        "summary": response_text,
-                        "action_items": [],
-                        "decisions": []
-                    }
-                    
-            except json.JSONDecodeError as e:
-                print(f"Error parsing JSON from Claude's response: {e}")
-                # Fallback structure
-                return {
-                    "summary": response_text,
-                    "action_items": [],
-                    "decisions": []
-                }
+
+        # The forced tool call returns the digest as a structured dict
+        summary_data = next(block.input for block in response.content if block.type == "tool_use")
+        self._cache_store(cache_key, summary_data)
+        return summary_data
+
+    async def _summarise(self, chunks):
+        """Summarise chunks of formatted messages, map-reducing if there is more than one."""
+        semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+        async with AsyncAnthropic(api_key=self.anthropic_api_key) as client:
+            # Short conversations fit in a single call
+            if len(chunks) == 1:
+                return await self._create_digest(client, semaphore, PROMPT_PREFIX, chunks[0])
+
+            # Map: summarise each chunk in parallel
+            partials = await asyncio.gather(*(
+                self._create_digest(client, semaphore, CHUNK_PROMPT_PREFIX, chunk)
+                for chunk in chunks
+            ))
+
+            # Reduce: merge the partial digests into the final one
+            return await self._create_digest(client, semaphore, REDUCE_PROMPT_PREFIX, json.dumps(partials, indent=2, ensure_ascii=False))
+
+    def generate_summary(self, messages):
+        """Generate summary using Claude."""
+        messages = list(messages)
+        last_ts = max((float(msg["ts"]) for msg in messages), default=0.0)
+        return self._generate_summary(_format_messages(messages), last_ts)
+
+    def _generate_summary(self, formatted_messages, last_ts):
+        """Generate summary of formatted messages, the newest sent at last_ts."""
+        if not formatted_messages:
+            return "No messages found in the specified timeframe."
+
+        # Repeated messages ("+1", bot pings) add tokens but no content
+        formatted_messages = _dedupe(formatted_messages)
+        messages_text = "\n".join(formatted_messages)
+
+        # Skip the API call if these messages have already been summarised
+        cache_key = self._cache_key(PROMPT_PREFIX, messages_text)
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            return cached
+
+        # Fall back to a summary of a near-identical message set
+        n_messages = len(formatted_messages)
+        embedding = self._semantic_embed(formatted_messages)
+        cached = self._semantic_lookup(embedding, n_messages, last_ts)
+        if cached is not None:
+            return cached
+
+        try:
+            chunks = _chunk_by_tokens(formatted_messages)
+            summary_data = asyncio.run(self._summarise(chunks))
+            # A single chunk was already cached under this key by _create_digest
+            if len(chunks) > 1:
+                self._cache_store(cache_key, summary_data)
+            self._semantic_store(embedding, n_messages, last_ts, summary_data)
+            return summary_data
             
         except Exception as e:
             print(f"Error generating summary: {e}")
             return None
 
+        # Write the cache once per summary, keeping any chunks that succeeded
+        finally:
+            self._cache_flush()
+
     def save_to_file(self, messages, summary, filename):
         """Save messages and summary to a text file."""
         try:
-            with open(filename, 'w') as f:
+            with open(filename, 'w', buffering=WRITE_BUFFER_SIZE, encoding="utf-8") as f:
                 # Write original messages
-                f.write("=== Original Messages ===\n\n")
-                for msg in messages:
-                    timestamp = datetime.fromtimestamp(float(msg["ts"]))
-                    f.write(f"{timestamp}: {msg.get('text', '')}\n")
+                f.write(MESSAGES_HEADER)
+                f.writelines(f"{_format_message(msg)}\n" for msg in messages)
                 
-                f.write("\n=== Summary ===\n\n")
-                f.write(json.dumps(summary, indent=2))
+                f.write(SUMMARY_HEADER)
+                f.write(_dumps_summary(summary))
                 
             return True
         except Exception as e:
@@ -164,43 +652,22 @@ class SlackerBot:
             {
                 "type": "divider"
             },
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": "*Summary:*\n" + summary_data["summary"]
-                }
-            }
+            _mrkdwn_section("*Summary:*\n" + summary_data["summary"])
         ]
         
-        # Add action items if present
-        if summary_data["action_items"]:
-            action_items = "\n".join([f"• {item}" for item in summary_data["action_items"]])
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*Action Items:*\n{action_items}"
-                }
-            })
-        
-        # Add decisions if present
-        if summary_data["decisions"]:
-            decisions = "\n".join([f"• {item}" for item in summary_data["decisions"]])
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"*Key Decisions:*\n{decisions}"
-                }
-            })
+        # Add a bulleted section for each list that is present
+        blocks.extend(
+            _mrkdwn_section(f"*{title}:*\n" + "\n".join(map("• {}".format, summary_data[key])))
+            for key, title in LIST_SECTIONS
+            if summary_data[key]
+        )
             
         return blocks
 
     def post_to_slack(self, channel_id, blocks):
         """Post formatted blocks to Slack channel."""
         try:
-            response = self.slack_client.chat_postMessage(
+            self.slack_client.chat_postMessage(
                 channel=channel_id,
                 blocks=blocks
             )
@@ -210,30 +677,79 @@ class SlackerBot:
             print(f"Error posting to Slack: {e.response['error']}")
             return False
 
+    def _warm_caches(self):
+        """Load the summary caches (and embedding model) ahead of summarising, best effort."""
+        # Failures here must not stop the digest
+        try:
+            self._cache_load()
+            self._semantic_load()
+        except Exception as e:
+            print(f"Error loading summary caches: {e}")
+
     def process_channel(self, channel_id, start_time, end_time, output_file, post_to_slack=False):
         """Process a channel's messages and generate summary."""
-        # Fetch messages
-        messages = self.fetch_messages(channel_id, start_time, end_time)
+        # Write to a temporary file, so a failed run leaves no partial output behind
+        partial_file = output_file + ".partial"
+        try:
+            with open(partial_file, 'w', buffering=WRITE_BUFFER_SIZE, encoding="utf-8") as f, ThreadPoolExecutor(max_workers=1) as executor:
+                # Load the caches in the background while messages are fetched
+                warm_caches = executor.submit(self._warm_caches)
+
+                # Write original messages as they arrive, keeping only the formatted lines
+                f.write(MESSAGES_HEADER)
+                formatted_messages = []
+                last_ts = 0.0
+                for msg in self.iter_messages(channel_id, start_time, end_time):
+                    line = _format_message(msg)
+                    f.write(f"{line}\n")
+                    formatted_messages.append(line)
+                    last_ts = max(last_ts, float(msg["ts"]))
+                warm_caches.result()
+
+                # Generate summary
+                summary = self._generate_summary(formatted_messages, last_ts)
+
+                # Save to file
+                if summary:
+                    f.write(SUMMARY_HEADER)
+                    f.write(_dumps_summary(summary))
+            os.replace(partial_file, output_file)
+
+        # Don't summarise or post a partial history; other API errors are raised
+        except SlackApiError as e:
+            if e.response["error"] not in TERMINAL_SLACK_ERRORS:
+                raise
+            print(f"Error fetching messages: {e.response['error']}")
+            return False
+
+        # Connection errors subclass OSError, so catch them first
+        except aiohttp.ClientError as e:
+            print(f"Error connecting to Slack: {e}")
+            return False
+
+        except OSError as e:
+            print(f"Error saving to file: {e}")
+            return False
+
+        finally:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
 
-        # Generate summary
-        summary = self.generate_summary(messages)
-        
         success = False
         if summary:
-            # Save to file
-            file_success = self.save_to_file(messages, summary, output_file)
-
             print("---> Summary:\n", summary)
             
             # Post to Slack if requested
-            slack_success = True
-            if post_to_slack:
+            success = True
+            if post_to_slack and not isinstance(summary, dict):
+                # No messages, so there is no digest to post; don't report a post as done
+                print("No messages found, nothing posted to Slack")
+                success = False
+            elif post_to_slack:
                 # Format message blocks
                 blocks = self.format_slack_message(summary, start_time, end_time)
                 # Post to Slack
-                slack_success = self.post_to_slack(channel_id, blocks)
-            
-            success = file_success and slack_success
+                success = self.post_to_slack(channel_id, blocks)
             
         return success
 